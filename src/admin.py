@@ -1,11 +1,19 @@
 """Admin utilities and management with ECC security"""
+import errno
 import os
+import shutil
 from src.secure_storage import ECCSecureStorage
 
+_IMG_EXT_SET = frozenset({".jpg", ".jpeg", ".png"})
+# os.link errors meaning the filesystem can't hardlink here, so a copy is made instead
+_LINK_UNSUPPORTED = frozenset({errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK})
+
 class AdminManager:
     def __init__(self):
         self.storage = ECCSecureStorage()
         self.admin_password = "default"
+        self._dir_cache = {}
+        self._stats_cache = None
         try:
             self.data = self.storage.load_data(password=self.admin_password)
         except:
@@ -23,32 +31,52 @@ class AdminManager:
             self.data['admin']['password'] = self.storage.double_hash_password(new_pass)
             self.storage.save_data(self.data, new_pass)
             self.admin_password = new_pass
+            self._stats_cache = None
             return True
         return False
     
+    def _list_dir_cached(self, d):
+        """List image files in d, rescanning only when the directory mtime changes"""
+        try:
+            mtime = os.stat(d).st_mtime_ns
+        except FileNotFoundError:
+            self._dir_cache.pop(d, None)
+            return (), None
+        
+        cached = self._dir_cache.get(d)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], mtime
+        
+        with os.scandir(d) as it:
+            files = tuple(entry.name for entry in it if os.path.splitext(entry.name)[1].lower() in _IMG_EXT_SET)
+        self._dir_cache[d] = (mtime, files)
+        return files, mtime
+    
     def list_known_faces(self):
         """List all known faces"""
-        known_dir = "src/facebase/known_faces"
-        if os.path.exists(known_dir):
-            return [f for f in os.listdir(known_dir) if f.endswith(('.jpg', '.jpeg', '.png'))]
-        return []
+        return list(self._list_dir_cached("src/facebase/known_faces")[0])
     
     def list_unknown_faces(self):
         """List all unknown faces"""
-        unknown_dir = "src/facebase/unknown_faces"
-        if os.path.exists(unknown_dir):
-            return [f for f in os.listdir(unknown_dir) if f.endswith(('.jpg', '.jpeg', '.png'))]
-        return []
+        return list(self._list_dir_cached("src/facebase/unknown_faces")[0])
     
     def get_stats(self):
         """Get system statistics"""
-        return {
-            'known_faces': len(self.list_known_faces()),
-            'unknown_faces': len(self.list_unknown_faces()),
+        known, known_mtime = self._list_dir_cached("src/facebase/known_faces")
+        unknown, unknown_mtime = self._list_dir_cached("src/facebase/unknown_faces")
+        key = (known_mtime, unknown_mtime)
+        if self._stats_cache is not None and self._stats_cache[0] == key:
+            return dict(self._stats_cache[1])
+        
+        stats = {
+            'known_faces': len(known),
+            'unknown_faces': len(unknown),
             'admin_enrolled': self.data.get('admin', {}).get('face_enrolled', False),
             'public_key': self.storage.get_public_key_address(),
             'ecc_curve': 'SECP256k1 (Bitcoin)'
         }
+        self._stats_cache = (key, stats)
+        return dict(stats)
     
     def add_face_to_known(self, unknown_filename, person_name):
         """Move unknown face to known faces with name"""
@@ -57,8 +85,18 @@ class AdminManager:
         
         if os.path.exists(unknown_path):
             try:
-                import shutil
-                shutil.copy2(unknown_path, known_path)
+                # An existing face with this name is replaced, as the original copy did
+                if os.path.lexists(known_path):
+                    os.unlink(known_path)
+                # Hardlink (no data copied); copy where links are unsupported. Either way the unknown file stays
+                try:
+                    os.link(unknown_path, known_path)
+                except OSError as e:
+                    if e.errno not in _LINK_UNSUPPORTED:
+                        raise
+                    shutil.copy2(unknown_path, known_path)
+                self._dir_cache.clear()
+                self._stats_cache = None
                 print(f"Added {person_name} to known faces")
                 return True
             except Exception as e:
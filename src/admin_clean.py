@@ -8,6 +8,14 @@ class AdminInterface:
     def __init__(self):
         self.manager = AdminManager()
         self.authenticated = False
+        self._deepface = None
+    
+    @property
+    def deepface(self):
+        """Shared DeepFace provider, created on first analysis"""
+        if self._deepface is None:
+            self._deepface = DeepFaceProvider()
+        return self._deepface
     
     def authenticate(self):
         """Authenticate admin user with ECC"""
@@ -154,7 +162,8 @@ class AdminInterface:
     
     def analyze_face_deepface(self):
         """Analyze a face using DeepFace"""
-        faces = self.manager.list_unknown_faces() + self.manager.list_known_faces()
+        unknowns = self.manager.list_unknown_faces()
+        faces = unknowns + self.manager.list_known_faces()
         if not faces:
             print("No faces available for analysis")
             return
@@ -167,14 +176,13 @@ class AdminInterface:
             idx = int(input("\nSelect face to analyze: ")) - 1
             if 0 <= idx < len(faces):
                 # Determine path
-                if faces[idx] in self.manager.list_unknown_faces():
+                if idx < len(unknowns):
                     path = os.path.join("src/facebase/unknown_faces", faces[idx])
                 else:
                     path = os.path.join("src/facebase/known_faces", faces[idx])
                 
                 print("\nAnalyzing with DeepFace...")
-                provider = DeepFaceProvider()
-                result = provider.analyze_face(path)
+                result = self.deepface.analyze_face(path)
                 
                 print("\n" + "="*50)
                 print("DEEPFACE ANALYSIS")
@@ -1,64 +1,123 @@
 """AI API wrappers for OpenAI and DeepFace"""
+import asyncio
+import importlib.util
+import logging
+import multiprocessing as mp
 import os
+import queue
 import sys
+from functools import cached_property, lru_cache
 from src.ai_core import AIProvider, MockAIProvider
 
+log = logging.getLogger(__name__)
+
 class OpenAIProvider(AIProvider):
     """OpenAI GPT integration for event analysis"""
     
+    # One client per API key, shared by all instances
+    _clients = {}
+    timeout = 30.0
+    max_connections = 16
+    
     def __init__(self, api_key=None):
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
-            print("Warning: OPENAI_API_KEY not set. Using mock responses.")
-            self.enabled = False
-        else:
-            self.enabled = True
-            try:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=self.api_key)
-                print("✓ OpenAI provider initialized")
-            except ImportError:
-                print("Warning: openai package not installed. Run: pip install openai")
-                self.enabled = False
-            except Exception as e:
-                print(f"Warning: OpenAI initialization failed: {e}")
-                self.enabled = False
+        self.enabled = bool(self.api_key)
+        self._warned = False
     
-    def analyze_face(self, image_path):
-        """OpenAI doesn't do face analysis - delegate to DeepFace"""
-        return {"note": "Use DeepFace for facial analysis"}
+    @cached_property
+    def client(self):
+        """OpenAI client, created on first use and reused across instances"""
+        client = OpenAIProvider._clients.get(self.api_key)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAIProvider._clients[self.api_key] = OpenAI(api_key=self.api_key, timeout=self.timeout)
+            log.info("✓ OpenAI provider initialized")
+        return client
     
-    def process_event(self, event_data):
-        """Process surveillance event with GPT analysis"""
+    def _ensure_client(self):
+        """Create the client on first use; disable the provider if that is not possible"""
         if not self.enabled:
-            return f"[Mock] Detected {event_data.get('name', 'Unknown')}"
+            if not self._warned and not self.api_key:
+                log.warning("OPENAI_API_KEY not set. Using mock responses.")
+                self._warned = True
+            return False
         
         try:
-            prompt = f"""Analyze this surveillance event briefly (one sentence):
+            self.client
+            return True
+        except ImportError:
+            log.warning("openai package not installed. Run: pip install openai")
+        except Exception as e:
+            log.warning("OpenAI initialization failed: %s", e)
+        self.enabled = False
+        return False
+    
+    def analyze_face(self, image_path):
+        """OpenAI doesn't do face analysis - delegate to DeepFace"""
+        return {"note": "Use DeepFace for facial analysis"}
+    
+    @staticmethod
+    def _event_request(event_data):
+        """Chat completion arguments for a single surveillance event"""
+        prompt = f"""Analyze this surveillance event briefly (one sentence):
 Event: {event_data.get('type')}
 Person: {event_data.get('name', 'Unknown')}
 Confidence: {event_data.get('confidence', 0):.2%}
 Time: {event_data.get('timestamp')}
 
 Provide a security assessment."""
-
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a security analyst. Respond in one brief sentence."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=50,
-                temperature=0.7
-            )
-            
+        
+        return {
+            'model': "gpt-4",
+            'messages': [
+                {"role": "system", "content": "You are a security analyst. Respond in one brief sentence."},
+                {"role": "user", "content": prompt}
+            ],
+            'max_tokens': 50,
+            'temperature': 0.7
+        }
+    
+    def process_event(self, event_data):
+        """Process surveillance event with GPT analysis"""
+        if not self._ensure_client():
+            return f"[Mock] Detected {event_data.get('name', 'Unknown')}"
+        
+        try:
+            response = self.client.chat.completions.create(**self._event_request(event_data))
             return response.choices[0].message.content.strip()
         except Exception as e:
             return f"[OpenAI Error: {str(e)[:50]}]"
     
+    async def aprocess_events(self, events):
+        """Analyze a burst of events concurrently, returning one response per event"""
+        if not events:
+            return []
+        if not self._ensure_client():
+            return [f"[Mock] Detected {e.get('name', 'Unknown')}" for e in events]
+        
+        import httpx
+        from openai import AsyncOpenAI
+        
+        # The async transport is bound to the running event loop, so it lives for one burst
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections)) as http_client:
+            client = AsyncOpenAI(api_key=self.api_key, http_client=http_client, timeout=self.timeout)
+            responses = await asyncio.gather(
+                *[client.chat.completions.create(**self._event_request(e)) for e in events],
+                return_exceptions=True
+            )
+        
+        return [
+            f"[OpenAI Error: {str(r)[:50]}]" if isinstance(r, Exception) else r.choices[0].message.content.strip()
+            for r in responses
+        ]
+    
+    def process_events(self, events):
+        """Synchronous wrapper around aprocess_events (not callable from a running event loop)"""
+        return asyncio.run(self.aprocess_events(events))
+    
     def generate_summary(self, events):
         """Generate narrative summary of multiple events"""
-        if not self.enabled or not events:
+        if not events or not self._ensure_client():
             return f"Mock summary: {len(events)} events recorded"
         
         try:
@@ -85,21 +144,145 @@ Provide an executive security summary."""
             return f"Summary generation failed: {str(e)[:100]}"
 
 
+def _deepface_worker_main(q_in, q_out):
+    """Worker process loop: build the models once, then serve analyze/verify tasks"""
+    provider = DeepFaceProvider(use_worker=False, quiet=True)
+    try:
+        provider.warmup()
+        q_out.put(("ready", None))
+    except Exception as e:
+        q_out.put(("failed", str(e)[:100]))
+        return
+    
+    for task in iter(q_in.get, None):
+        kind, args = task
+        if kind == "analyze":
+            q_out.put(("ok", provider._analyze_local(*args)))
+        elif kind == "verify":
+            q_out.put(("ok", provider._verify_local(*args)))
+        else:
+            q_out.put(("ok", {"error": f"Unknown task: {kind}"}))
+
+
+class DeepFaceWorker:
+    """Persistent DeepFace process, recycled after max_requests to bound TF memory growth"""
+    
+    def __init__(self, max_requests=500, timeout=30, startup_poll=1.0):
+        self.max_requests = max_requests
+        self.timeout = timeout
+        # Startup has no deadline (the first run downloads ~1.5 GB of weights); just re-check the child this often
+        self.startup_poll = startup_poll
+        # Spawn, not fork: the parent runs other threads (event writer, OpenCV pool) by now,
+        # and a forked child can inherit one of their held locks and hang on its first print
+        self._ctx = mp.get_context("spawn")
+        self._process = None
+        self._ready = False
+        self._served = 0
+    
+    def start(self):
+        """Spawn the worker process"""
+        self._q_in = self._ctx.Queue()
+        self._q_out = self._ctx.Queue()
+        self._process = self._ctx.Process(target=_deepface_worker_main, args=(self._q_in, self._q_out), daemon=True)
+        self._process.start()
+        self._ready = False
+        self._served = 0
+    
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        if self._process is None:
+            return
+        try:
+            self._q_in.put(None)
+            self._process.join(timeout=5)
+        finally:
+            if self._process.is_alive():
+                self._process.kill()
+            self._process = None
+    
+    def _wait_ready(self):
+        """Wait for the worker's startup message for as long as the process is alive"""
+        while True:
+            try:
+                return self._q_out.get(timeout=self.startup_poll)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    return "failed", f"exited with code {self._process.exitcode}"
+    
+    def submit(self, kind, *args):
+        """Run a task in the worker and return its result dict"""
+        if self._process is None or not self._process.is_alive():
+            self.start()
+        
+        try:
+            if not self._ready:
+                status, detail = self._wait_ready()
+                if status != "ready":
+                    self.stop()
+                    return {"error": f"DeepFace worker failed to start: {detail}"}
+                self._ready = True
+            
+            self._q_in.put((kind, args))
+            _, result = self._q_out.get(timeout=self.timeout)
+        except queue.Empty:
+            # A hung worker would also hold its queue; replace it on the next call
+            self.stop()
+            return {"error": "DeepFace worker timed out"}
+        
+        self._served += 1
+        if self._served >= self.max_requests:
+            self.stop()
+        return result
+
+
 class DeepFaceProvider(AIProvider):
     """DeepFace integration for facial attribute analysis"""
     
-    def __init__(self):
-        try:
+    # Imported DeepFace module and attribute models, shared by all instances
+    _DF = None
+    _models = {}
+    _actions = {'age': 'Age', 'gender': 'Gender', 'emotion': 'Emotion', 'race': 'Race'}
+    # Worker process shared by all instances that use one
+    _worker = None
+    
+    def __init__(self, use_worker=True, quiet=False):
+        self.use_worker = use_worker
+        # find_spec locates the package without paying the TensorFlow import
+        self.enabled = DeepFaceProvider._DF is not None or importlib.util.find_spec("deepface") is not None
+        if quiet:
+            return
+        if self.enabled:
+            log.info("✓ DeepFace provider initialized")
+        else:
+            log.warning("deepface not installed. Run: pip install deepface")
+    
+    @property
+    def DeepFace(self):
+        """DeepFace module, imported the first time it is needed"""
+        if DeepFaceProvider._DF is None:
             from deepface import DeepFace
-            self.DeepFace = DeepFace
-            self.enabled = True
-            print("✓ DeepFace provider initialized")
-        except ImportError:
-            print("Warning: deepface not installed. Run: pip install deepface")
-            self.enabled = False
-        except Exception as e:
-            print(f"Warning: DeepFace init failed: {e}")
-            self.enabled = False
+            DeepFaceProvider._DF = DeepFace
+        return DeepFaceProvider._DF
+    
+    def warmup(self):
+        """Build the attribute models once so the first analysis doesn't pay for it"""
+        for action, model_name in self._actions.items():
+            if action not in DeepFaceProvider._models:
+                DeepFaceProvider._models[action] = self.DeepFace.build_model(model_name)
+    
+    def _submit(self, kind, *args):
+        """Run a task in the shared worker process"""
+        if DeepFaceProvider._worker is None:
+            DeepFaceProvider._worker = DeepFaceWorker()
+        return DeepFaceProvider._worker.submit(kind, *args)
+    
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _extract(path, mtime):
+        """Detect and crop the face once per (path, mtime); returns a BGR uint8 crop"""
+        face = DeepFaceProvider._DF.extract_faces(img_path=path, enforce_detection=False)[0]["face"]
+        # extract_faces returns RGB in [0, 1]; analyze expects BGR pixels like cv2.imread
+        return (face[:, :, ::-1] * 255).astype("uint8")
     
     def analyze_face(self, image_path):
         """Analyze facial attributes: age, gender, emotion, race"""
@@ -109,10 +292,20 @@ class DeepFaceProvider(AIProvider):
         if not os.path.exists(image_path):
             return {"error": "Image not found"}
         
+        if self.use_worker:
+            return self._submit("analyze", image_path)
+        return self._analyze_local(image_path)
+    
+    def _analyze_local(self, image_path):
+        """Run the analysis in this process"""
         try:
+            self.warmup()
+            # Keyed by mtime so an edited file is re-detected
+            crop = self._extract(image_path, os.path.getmtime(image_path))
             analysis = self.DeepFace.analyze(
-                img_path=image_path,
-                actions=['age', 'gender', 'emotion', 'race'],
+                img_path=crop,
+                actions=list(self._actions),
+                detector_backend="skip",
                 enforce_detection=False,
                 silent=True
             )
@@ -147,6 +340,12 @@ class DeepFaceProvider(AIProvider):
         if not self.enabled:
             return {"verified": False, "message": "DeepFace not available"}
         
+        if self.use_worker:
+            return self._submit("verify", img1_path, img2_path)
+        return self._verify_local(img1_path, img2_path)
+    
+    def _verify_local(self, img1_path, img2_path):
+        """Run verification in this process"""
         try:
             result = self.DeepFace.verify(
                 img1_path=img1_path,
@@ -175,10 +374,10 @@ class AIAdapter:
             elif name == "mock":
                 return MockAIProvider()
             else:
-                print(f"Provider '{name}' not found, using mock")
+                log.warning("Provider '%s' not found, using mock", name)
                 return MockAIProvider()
         except Exception as e:
-            print(f"Error loading provider: {e}")
+            log.error("Error loading provider: %s", e)
             return MockAIProvider()
     
     def analyze(self, data):
@@ -194,6 +393,16 @@ class AIAdapter:
             print(f"Analysis error: {e}")
             return f"Error: {str(e)[:50]}"
     
+    def analyze_events(self, events):
+        """Analyze several events, concurrently when the provider supports it"""
+        try:
+            if hasattr(self.provider, 'process_events'):
+                return self.provider.process_events(events)
+            return [self.provider.process_event(e) for e in events]
+        except Exception as e:
+            print(f"Analysis error: {e}")
+            return [f"Error: {str(e)[:50]}"] * len(events)
+    
     def summarize(self, events):
         """Generate event summary"""
         try:
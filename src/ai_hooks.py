@@ -1,19 +1,19 @@
 """Event-driven AI integration"""
+from collections import defaultdict
 
 class AIHooks:
     def __init__(self, adapter):
         self.adapter = adapter
-        self.hooks = []
+        self.hooks = defaultdict(list)
     
     def register_hook(self, event_type, callback):
         """Register event hook"""
-        self.hooks.append({'type': event_type, 'callback': callback})
+        self.hooks[event_type].append(callback)
     
     def trigger(self, event_type, data):
         """Trigger hooks for event"""
-        for hook in self.hooks:
-            if hook['type'] == event_type:
-                try:
-                    hook['callback'](data)
-                except Exception as e:
-                    print(f"Hook error: {e}")
+        for callback in self.hooks.get(event_type, ()):
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"Hook error: {e}")
@@ -1,81 +1,444 @@
 """Face recognition engine"""
+import logging
 import os
-import cv2
-import face_recognition
 import numpy as np
 from pathlib import Path
 
+log = logging.getLogger(__name__)
+
+# Heavy imports are deferred until an engine is created (see _import_libs)
+cv2 = None
+dlib = None
+face_recognition = None
+
+_IMG_EXT_SET = frozenset({".jpg", ".jpeg", ".png"})
+
+# face_recognition's L2 match cutoff, and the equivalent cosine similarity
+# for unit vectors (||a - b||^2 = 2 - 2 a.b)
+MATCH_DISTANCE = 0.6
+SIM_THRESHOLD = 1 - MATCH_DISTANCE ** 2 / 2
+
+def _l2_normalize(vectors):
+    """Return rows of vectors as a contiguous, unit-length float32 matrix"""
+    mat = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    mat /= np.maximum(norms, np.finfo(np.float32).tiny)
+    return mat
+
+# Numba-compiled utils._jit.best_match, or None when numba is not installed
+_best_match = None
+
+def _import_libs():
+    """Import OpenCV, dlib and face_recognition once, on first use"""
+    global cv2, dlib, face_recognition, _best_match
+    if face_recognition is None:
+        import cv2 as _cv2
+        import dlib as _dlib
+        import face_recognition as _face_recognition
+        cv2, dlib, face_recognition = _cv2, _dlib, _face_recognition
+        
+        from utils._jit import HAVE_NUMBA, best_match
+        if not HAVE_NUMBA:
+            return
+        _best_match = best_match
+        # Compile now rather than on the first detected face
+        _best_match(np.zeros((1, 128), dtype=np.float32), np.zeros((1, 128), dtype=np.float32))
+
 class FaceRecognitionEngine:
-    def __init__(self, known_faces_dir="src/facebase/known_faces"):
+    match_threshold = SIM_THRESHOLD
+    # Landmark model used for alignment: 68-point for the one-time gallery build,
+    # the ~3x cheaper 5-point model for live frames
+    gallery_encoder_model = "large"
+    live_encoder_model = "small"
+    # Gallery size below which the fused Numba kernel beats BLAS/FAISS setup cost
+    jit_max_size = 512
+    # Gallery size at which the FAISS index switches from exact to HNSW search
+    hnsw_min_size = 10000
+    # Gray-level change at which a detection-image pixel counts as moved
+    motion_pixel_delta = 25
+    
+    def __init__(self, known_faces_dir="src/facebase/known_faces", batch_size=None, quantize=False,
+                 unknown_faces_dir="src/facebase/unknown_faces", motion_eps=0.002):
+        _import_libs()
         self.known_faces_dir = known_faces_dir
-        self.known_encodings = []
+        self.unknown_faces_dir = unknown_faces_dir
+        self._unknown_count = self._scan_unknown_count()
+        self.quantize = quantize
+        self.batch_size = max(1, int(batch_size or os.getenv('BATCH_SIZE', 8)))
+        # Frames are downscaled by this factor before detection
+        self.scale = 0.25
+        # CNN detector only pays off when dlib was built with CUDA
+        self.detector_model = "cnn" if dlib.DLIB_USE_CUDA else "hog"
+        self.upsample = 0 if self.detector_model == "cnn" else 1
+        self._cache_path = os.path.join(known_faces_dir, "encodings.npz")
+        self.known_encodings = np.empty((0, 128), dtype=np.float32)
         self.known_names = []
+        self.kenc_i8 = None
+        self.kenc_scale = 1.0
+        self.index = None
+        # Preallocated (resized BGR, RGB) buffers per detection image shape
+        self._buffers = {}
+        self._small_buf = None
+        # Fraction of changed pixels below which a frame counts as static (0 disables); 0.002 is
+        # ~115 px of a 320x180 detection image, well under a 25x25 face entering the scene
+        self.motion_eps = motion_eps
+        self._prev_small_gray = None
+        self._last_detections = ([], [], [])
         self.load_known_faces()
     
+    def _load_encoding_cache(self):
+        """Load cached encodings as {filename: (mtime, encoding)}; encoding is None for faceless images"""
+        if not os.path.exists(self._cache_path):
+            return {}
+        try:
+            with np.load(self._cache_path) as data:
+                # Encodings from a different landmark model are not comparable; rebuild
+                if 'encoder_model' not in data.files or str(data['encoder_model']) != self.gallery_encoder_model:
+                    return {}
+                cache = {
+                    str(filename): (float(mtime), encoding)
+                    for filename, mtime, encoding in zip(data['filenames'], data['mtimes'], data['encodings'])
+                }
+                if 'faceless' in data.files:
+                    cache.update(
+                        (str(filename), (float(mtime), None))
+                        for filename, mtime in zip(data['faceless'], data['faceless_mtimes'])
+                    )
+                return cache
+        except Exception as e:
+            log.warning("Ignoring unreadable encoding cache: %s", e)
+            return {}
+    
+    def _save_encoding_cache(self, entries):
+        """Persist {filename: (mtime, encoding)} next to the known faces"""
+        filenames = sorted(f for f in entries if entries[f][1] is not None)
+        faceless = sorted(f for f in entries if entries[f][1] is None)
+        try:
+            np.savez(
+                self._cache_path,
+                encoder_model=np.array(self.gallery_encoder_model),
+                filenames=np.array(filenames, dtype=str),
+                mtimes=np.array([entries[f][0] for f in filenames], dtype=np.float64),
+                encodings=np.array([entries[f][1] for f in filenames], dtype=np.float64).reshape(-1, 128),
+                # Images with no detectable face, so they aren't decoded and searched again each startup
+                faceless=np.array(faceless, dtype=str),
+                faceless_mtimes=np.array([entries[f][0] for f in faceless], dtype=np.float64)
+            )
+        except Exception as e:
+            log.warning("Failed to write encoding cache: %s", e)
+    
     def load_known_faces(self):
-        """Load all known faces from directory"""
-        self.known_encodings = []
+        """Load all known faces from directory, reusing cached encodings"""
+        self.known_encodings = np.empty((0, 128), dtype=np.float32)
         self.known_names = []
+        self.kenc_i8 = None
+        self.index = None
+        self._prev_small_gray = None
         
         if not os.path.exists(self.known_faces_dir):
             os.makedirs(self.known_faces_dir, exist_ok=True)
-            print("No known faces found. Add images to src/facebase/known_faces/")
+            log.info("No known faces found. Add images to src/facebase/known_faces/")
             return
         
-        for filename in os.listdir(self.known_faces_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                path = os.path.join(self.known_faces_dir, filename)
+        cache = self._load_encoding_cache()
+        entries = {}
+        encodings = []
+        dirty = False
+        
+        with os.scandir(self.known_faces_dir) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                filename = entry.name
+                if not entry.is_file() or os.path.splitext(filename)[1].lower() not in _IMG_EXT_SET:
+                    continue
                 try:
-                    image = face_recognition.load_image_file(path)
-                    encodings = face_recognition.face_encodings(image)
+                    mtime = entry.stat().st_mtime
+                    cached = cache.get(filename)
+                    if cached is not None and cached[0] == mtime:
+                        encoding = cached[1]
+                    else:
+                        image = face_recognition.load_image_file(entry.path)
+                        found = face_recognition.face_encodings(image, num_jitters=1, model=self.gallery_encoder_model)
+                        encoding = found[0] if found else None
+                        dirty = True
                     
-                    if encodings:
-                        self.known_encodings.append(encodings[0])
-                        name = os.path.splitext(filename)[0].replace('_', ' ').title()
-                        self.known_names.append(name)
-                        print(f"  Loaded: {name}")
+                    entries[filename] = (mtime, encoding)
+                    if encoding is None:
+                        log.debug("  No face found: %s", filename)
+                        continue
+                    encodings.append(encoding)
+                    name = os.path.splitext(filename)[0].replace('_', ' ').title()
+                    self.known_names.append(name)
+                    log.debug("  Loaded: %s", name)
                 except Exception as e:
-                    print(f"  Error loading {filename}: {e}")
+                    log.warning("  Error loading %s: %s", filename, e)
+        
+        if dirty or entries.keys() != cache.keys():
+            self._save_encoding_cache(entries)
+        if encodings:
+            # Normalized once so matching is a dot product instead of an L2 distance
+            known = _l2_normalize(encodings)
+            self.known_encodings = known
+            # The int8 gallery replaces FAISS when quantization is requested
+            if self.quantize:
+                self._quantize_known()
+            else:
+                self.index = self._build_index(known)
         
-        print(f"Total known faces loaded: {len(self.known_names)}")
+        log.info("Total known faces loaded: %d", len(self.known_names))
     
-    def recognize_faces(self, frame):
-        """Detect and recognize faces in frame"""
-        # Resize frame for faster processing
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    def _quantize_known(self):
+        """Store an int8 copy of the normalized gallery"""
+        self.kenc_scale = 127.0 / float(np.max(np.abs(self.known_encodings)))
+        self.kenc_i8 = np.round(self.known_encodings * self.kenc_scale).astype(np.int8)
+    
+    def _build_index(self, known):
+        """Build a FAISS inner-product index over the normalized gallery, if faiss is installed"""
+        try:
+            import faiss
+        except ImportError:
+            return None
         
-        face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+        if len(known) >= self.hnsw_min_size:
+            # Approximate search once the gallery is large enough for a flat scan to hurt
+            index = faiss.IndexHNSWFlat(known.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexFlatIP(known.shape[1])
+        index.add(known)
+        return index
+    
+    def add_known_face(self, name, encoding):
+        """Add a single encoding to the in-memory gallery without reloading the directory"""
+        row = _l2_normalize(encoding)
+        self.known_encodings = np.ascontiguousarray(np.vstack([self.known_encodings, row]))
+        self.known_names.append(name)
+        if self.quantize:
+            self._quantize_known()
+        elif self.index is not None:
+            self.index.add(row)
+        else:
+            self.index = self._build_index(self.known_encodings)
+    
+    @staticmethod
+    def _small_shape(frame, scale):
+        """Shape of the scaled RGB detection image for a frame"""
+        h, w = frame.shape[:2]
+        return int(round(h * scale)), int(round(w * scale)), 3
+    
+    def _prepare_frame(self, frame, out=None, scale=None):
+        """Downscale BGR frame to the RGB image used for detection, reusing preallocated buffers"""
+        shape = self._small_shape(frame, scale or self.scale)
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            buffers = self._buffers[shape] = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+        small, rgb = buffers
+        if out is None:
+            out = rgb
         
+        # Resize frame for faster processing
+        if shape == frame.shape:
+            small = frame
+        else:
+            cv2.resize(frame, (shape[1], shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=out)
+        self._small_buf = small
+        return out
+    
+    def _detections(self, face_locations, face_encodings, matches, scale=None):
+        """Bundle one frame's results as (locations in frame coordinates, encodings, (name, confidence) matches)"""
+        scale = scale or self.scale
+        # Scale back up face locations
+        locations = [tuple(int(v / scale) for v in location) for location in face_locations]
+        return locations, list(face_encodings), list(matches)
+    
+    @staticmethod
+    def _build_soa(detections, include_encoding=False):
+        """Pack detections as new (names, confidences (K,), locations (K, 4) int32, encodings (K, 128) or None)"""
+        locations, encodings, matches = detections
+        names = [name for name, _ in matches]
+        confidences = np.array([confidence for _, confidence in matches], dtype=np.float32)
+        locations = np.array(locations, dtype=np.int32).reshape(-1, 4)
+        encodings = np.array(encodings, dtype=np.float64).reshape(-1, 128) if include_encoding else None
+        return names, confidences, locations, encodings
+    
+    @staticmethod
+    def _build_dicts(detections, include_encoding=False):
+        """Expand detections into per-face result dicts"""
+        locations, encodings, matches = detections
         results = []
-        for (top, right, bottom, left), encoding in zip(face_locations, face_encodings):
-            # Scale back up face locations
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
-            
-            name = "Unknown"
-            confidence = 0.0
-            
-            if self.known_encodings:
-                distances = face_recognition.face_distance(self.known_encodings, encoding)
-                best_match_idx = np.argmin(distances)
-                
-                if distances[best_match_idx] < 0.6:
-                    name = self.known_names[best_match_idx]
-                    confidence = 1.0 - distances[best_match_idx]
-            
-            results.append({
+        for location, encoding, (name, confidence) in zip(locations, encodings, matches):
+            result = {
                 'name': name,
-                'confidence': confidence,
-                'location': (top, right, bottom, left),
-                'encoding': encoding
-            })
+                'confidence': float(confidence),
+                'location': location
+            }
+            if include_encoding:
+                result['encoding'] = np.array(encoding)
+            results.append(result)
+        return results
+    
+    def _recognize(self, frame, scale=None, gated=True):
+        """Detections for one frame, reusing the last ones when the motion gate finds it static"""
+        scale = scale or self.scale
+        rgb_frame = self._prepare_frame(frame, scale=scale)
+        # The motion gate only tracks the regular full-frame stream; gated=False for other images
+        gated = gated and scale == self.scale
+        if gated and self._is_static():
+            return self._last_detections
+        
+        face_locations = face_recognition.face_locations(
+            rgb_frame, number_of_times_to_upsample=self.upsample, model=self.detector_model
+        )
+        face_encodings = face_recognition.face_encodings(
+            rgb_frame, face_locations, num_jitters=1, model=self.live_encoder_model
+        )
+        
+        matches = self._match_encodings(face_encodings)
+        detections = self._detections(face_locations, face_encodings, matches, scale)
+        if gated:
+            self._last_detections = detections
+        return detections
+    
+    def recognize_faces_soa(self, frame, include_encoding=False, scale=None, gated=True):
+        """Detect and recognize faces in frame as (names, confidences, locations, encodings or None)"""
+        return self._build_soa(self._recognize(frame, scale, gated), include_encoding)
+    
+    def recognize_faces(self, frame, include_encoding=False, scale=None, gated=True):
+        """Detect and recognize faces in frame, optionally at a detection scale other than self.scale"""
+        return self._build_dicts(self._recognize(frame, scale, gated), include_encoding)
+    
+    def _compare_to_reference(self):
+        """(static, gray) for the last prepared frame against the previous moving one"""
+        gray = cv2.cvtColor(self._small_buf, cv2.COLOR_BGR2GRAY)
+        prev = self._prev_small_gray
+        if prev is not None and prev.shape == gray.shape:
+            # Count moved pixels rather than averaging, so a small face entering a still scene isn't diluted
+            _, moved = cv2.threshold(cv2.absdiff(gray, prev), self.motion_pixel_delta, 255, cv2.THRESH_BINARY)
+            if cv2.countNonZero(moved) < self.motion_eps * gray.size:
+                return True, gray
+        return False, gray
+    
+    def _is_static(self):
+        """Compare the last prepared frame to the previous moving one; True if nothing changed"""
+        if not self.motion_eps:
+            return False
+        
+        static, gray = self._compare_to_reference()
+        if not static:
+            self._prev_small_gray = gray
+        return static
+    
+    def is_static(self, frame):
+        """True if the motion gate would treat frame as static; unlike recognition, the reference isn't advanced"""
+        if not self.motion_eps:
+            return False
+        
+        self._prepare_frame(frame)
+        return self._compare_to_reference()[0]
+    
+    def recognize_faces_batch(self, frames, include_encoding=False):
+        """Detect and recognize faces in a list of frames, returning one result list per frame"""
+        results = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = self._recognize_chunk(frames[start:start + self.batch_size])
+            results.extend(self._build_dicts(detections, include_encoding) for detections in chunk)
+        return results
+    
+    def _recognize_chunk(self, frames):
+        """Recognize up to batch_size same-sized frames with one embedding and matching pass; detections per frame"""
+        shape = self._small_shape(frames[0], self.scale)
+        if any(self._small_shape(frame, self.scale) != shape for frame in frames):
+            return [self._recognize(frame) for frame in frames]
+        
+        # Preprocess straight into one buffer of frames separated by black gutters of H/2 rows;
+        # dlib pads each face chip by 25% of the face size, so a chip never meets the next frame
+        height = shape[0]
+        stride = height + (height + 1) // 2
+        stacked = np.zeros((len(frames), stride) + shape[1:], dtype=np.uint8)
+        rgb_frames = [stacked[i, :height] for i in range(len(frames))]
+        moving = []
+        for i, (frame, rgb) in enumerate(zip(frames, rgb_frames)):
+            self._prepare_frame(frame, out=rgb)
+            # Same motion gate as _recognize, applied frame by frame in capture order
+            if not self._is_static():
+                moving.append(i)
         
+        per_frame_locations = [[] for _ in frames]
+        if self.detector_model == "cnn":
+            located = face_recognition.batch_face_locations(
+                [rgb_frames[i] for i in moving], number_of_times_to_upsample=self.upsample, batch_size=len(moving)
+            ) if moving else []
+        else:
+            located = [
+                face_recognition.face_locations(rgb_frames[i], number_of_times_to_upsample=self.upsample, model="hog")
+                for i in moving
+            ]
+        for i, locations in zip(moving, located):
+            per_frame_locations[i] = locations
+        
+        # View the batch as frames stacked vertically so every crop is embedded by a single face_encodings call
+        stacked = stacked.reshape(-1, shape[1], 3)
+        shifted = [
+            (top + i * stride, right, bottom + i * stride, left)
+            for i, locations in enumerate(per_frame_locations)
+            for (top, right, bottom, left) in locations
+        ]
+        encodings = face_recognition.face_encodings(
+            stacked, shifted, num_jitters=1, model=self.live_encoder_model
+        ) if shifted else []
+        matches = self._match_encodings(encodings)
+        
+        # Static frames repeat the results of the latest moving frame before them
+        results = []
+        offset = 0
+        detections = self._last_detections
+        moving = set(moving)
+        for i, locations in enumerate(per_frame_locations):
+            if i in moving:
+                end = offset + len(locations)
+                detections = self._detections(locations, encodings[offset:end], matches[offset:end])
+                offset = end
+            results.append(detections)
+        self._last_detections = detections
         return results
     
+    def _match_encodings(self, encodings):
+        """Match (K, 128) probe encodings against the known matrix, returning (name, confidence) pairs"""
+        if not len(encodings) or not len(self.known_encodings):
+            return [("Unknown", 0.0)] * len(encodings)
+        
+        probes = _l2_normalize(encodings)
+        if _best_match is not None and self.kenc_i8 is None and len(self.known_encodings) < self.jit_max_size:
+            # All probes in one sweep so the gallery passes through cache once per frame
+            best, dist2 = _best_match(self.known_encodings, probes)
+            best_sims = 1.0 - dist2 / 2.0
+        elif self.index is not None and self.kenc_i8 is None:
+            best_sims, best = self.index.search(probes, 1)
+            best_sims, best = best_sims[:, 0], best[:, 0]
+        else:
+            if self.kenc_i8 is not None:
+                sims = self._quantized_similarities(probes)
+            else:
+                sims = self.known_encodings @ probes.T
+            best = np.argmax(sims, axis=0)
+            best_sims = sims[best, np.arange(len(probes))]
+        
+        matches = []
+        for idx, sim in zip(best, best_sims):
+            if idx >= 0 and sim > self.match_threshold:
+                # Report confidence on the same 1 - L2 distance scale as before
+                distance = np.sqrt(max(0.0, 2.0 - 2.0 * float(sim)))
+                matches.append((self.known_names[idx], 1.0 - distance))
+            else:
+                matches.append(("Unknown", 0.0))
+        return matches
+    
+    def _quantized_similarities(self, probes):
+        """Approximate (N, K) cosine similarities from int8 gallery and probes"""
+        probe_scale = 127.0 / np.max(np.abs(probes), axis=1)
+        probes_i8 = np.round(probes * probe_scale[:, None]).astype(np.int8)
+        dots = np.einsum('nd,kd->nk', self.kenc_i8, probes_i8, dtype=np.int32)
+        return dots / (self.kenc_scale * probe_scale)
+    
     def save_unknown_face(self, frame, location):
         """Save unknown face for later identification"""
         top, right, bottom, left = location
@@ -88,11 +451,27 @@ class FaceRecognitionEngine:
         
         face_img = frame[top:bottom, left:right]
         
-        unknown_dir = "src/facebase/unknown_faces"
-        os.makedirs(unknown_dir, exist_ok=True)
-        
-        count = len([f for f in os.listdir(unknown_dir) if f.startswith('unknown_')])
-        filename = f"unknown_{count+1}.jpg"
-        filepath = os.path.join(unknown_dir, filename)
-        cv2.imwrite(filepath, face_img)
-        return filename
+        # Encode in memory, then claim the next free name with O_EXCL so concurrent savers never collide
+        _, jpeg = cv2.imencode('.jpg', face_img, [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        os.makedirs(self.unknown_faces_dir, exist_ok=True)
+        while True:
+            self._unknown_count += 1
+            filename = f"unknown_{self._unknown_count}.jpg"
+            filepath = os.path.join(self.unknown_faces_dir, filename)
+            try:
+                fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jpeg.tobytes())
+            return filename
+    
+    def _scan_unknown_count(self):
+        """Highest unknown_<n> index already saved, scanned once at startup"""
+        count = 0
+        if os.path.isdir(self.unknown_faces_dir):
+            for filename in os.listdir(self.unknown_faces_dir):
+                stem = os.path.splitext(filename)[0]
+                if stem.startswith('unknown_') and stem[len('unknown_'):].isdigit():
+                    count = max(count, int(stem[len('unknown_'):]))
+        return count
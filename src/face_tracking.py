@@ -2,22 +2,196 @@
 import cv2
 import time
 import os
+import queue
+import sys
+import threading
+import numpy as np
+from collections import OrderedDict, deque
 from datetime import datetime
+from utils.mosaic import box_iou, build_canvas, unmap_location
+from utils._jit import HAVE_NUMBA, dhash_bits
+
+_COLOR_KNOWN = (0, 255, 0)
+_COLOR_UNKNOWN = (0, 0, 255)
+
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+# (whole second, formatted string) so events within the same second share one strftime
+_ts_cache = (0, "")
+
+def _timestamp_str():
+    """Current local time formatted with _TS_FORMAT, cached per second"""
+    global _ts_cache
+    second = int(time.time())
+    if second != _ts_cache[0]:
+        _ts_cache = (second, datetime.fromtimestamp(second).strftime(_TS_FORMAT))
+    return _ts_cache[1]
+
+def _phash(frame):
+    """64-bit difference hash (dHash) of a BGR frame"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    if HAVE_NUMBA:
+        return int(dhash_bits(small))
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), 'big')
 
 class FaceTracker:
-    def __init__(self, recognition_engine, ai_adapter=None):
+    def __init__(self, recognition_engine, ai_adapter=None, mosaic=False, event_log_file=None):
         self.engine = recognition_engine
         self.ai_adapter = ai_adapter
-        self.tracked_faces = {}
-        self.events = []
+        if HAVE_NUMBA:
+            # Compile now rather than on the first tracked frame
+            dhash_bits(np.zeros((8, 9), dtype=np.uint8))
+        # Per-name tracking stats as parallel arrays; _name_to_idx maps a name to its slot
+        self._name_to_idx = {}
+        self._counts = np.zeros(256, dtype=np.int64)
+        self._totals = np.zeros(256, dtype=np.float64)
+        self._first = [None] * 256
+        self._last = [None] * 256
+        self.events = deque(maxlen=1000)  # Oldest events drop off automatically
         self.frame_count = 0
         self.unknown_save_interval = 30  # Save unknown faces every 30 frames
+        self._last_results = []
+        # Run recognition on every _detect_every-th frame and re-show the last boxes in between
+        self._detect_every = 3
+        # Detect only around last frame's faces, packed into one canvas; full frame every mosaic_refresh detections
+        self.mosaic = mosaic
+        self.mosaic_refresh = 10
+        self.mosaic_size = 640
+        self.mosaic_min_face = 64
+        # Recognition results memoized by perceptual frame hash
+        self._memo = OrderedDict()
+        self.memo_size = 64
+        self.memo_max_bits = 5  # Hamming distance at which two frames count as the same scene
+        self.memo_ttl = 2.0  # Seconds before a memoized result is considered stale
+        # Events are written by a background thread so the camera loop never blocks on stdout;
+        # started on the first event and stopped by close()
+        self.event_log_file = event_log_file
+        self._log_q = None
+        self._writer = None
+        self._log_batch = 100
+        # Face labels keyed by (name, confidence rounded to the displayed precision)
+        self._label_cache = {}
+        self._label_cache_size = 4096
+        # Black panel blended under the info text; only this region of the frame is touched
+        self._overlay_roi = np.zeros((110, 290, 3), dtype=np.uint8)
     
-    def process_frame(self, frame):
+    def process_frame(self, frame, fps=None):
         """Process single frame and track faces"""
+        if self.frame_count % self._detect_every:
+            return self._track_results(frame, list(self._last_results), fps)
+        
+        frame_hash = _phash(frame)
+        results = self._memo_lookup(frame_hash, frame)
+        if results is None:
+            results = self._recognize_regions(frame) if self.mosaic else None
+            if results is None:
+                results = self.engine.recognize_faces(frame)
+            self._memo_store(frame_hash, results)
+        return self._track_results(frame, results, fps)
+    
+    def _recognize_regions(self, frame):
+        """Recognize faces near the previous detections via one packed canvas; None means use the full frame"""
+        if not self._last_results or (self.frame_count // self._detect_every) % self.mosaic_refresh == 0:
+            return None
+        
+        h, w = frame.shape[:2]
+        # Both paths detect at engine.scale, so packing only saves work when the canvas is smaller than the frame
+        if self.mosaic_size ** 2 >= h * w:
+            return None
+        
+        crops, origins, anchors = [], [], []
+        for result in self._last_results:
+            top, right, bottom, left = result['location']
+            # Half a face of margin on every side so small movements stay inside the crop
+            pad_y, pad_x = (bottom - top) // 2, (right - left) // 2
+            y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+            x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+            if y1 <= y0 or x1 <= x0:
+                return None
+            crops.append(frame[y0:y1, x0:x1])
+            origins.append((x0, y0))
+            anchors.append(result['location'])
+        
+        # The face spans about half of its crop, so the crop must stay twice the minimum face size
+        packed = build_canvas(crops, self.mosaic_size, min_tile=2 * self.mosaic_min_face)
+        if packed is None:
+            return None
+        canvas, tiles = packed
+        
+        results = []
+        # Detected at the engine's usual scale, but kept out of its full-frame motion gate
+        for result in self.engine.recognize_faces(canvas, scale=self.engine.scale, gated=False):
+            mapped = unmap_location(result['location'], tiles)
+            if mapped is None:
+                continue
+            i, (top, right, bottom, left) = mapped
+            x0, y0 = origins[i]
+            location = (top + y0, right + x0, bottom + y0, left + x0)
+            # Padded crops of nearby faces contain each other; keep a face only in the tile built around it
+            overlaps = [box_iou(location, anchor) for anchor in anchors]
+            if overlaps[i] == 0.0 or overlaps[i] < max(overlaps):
+                continue
+            result['location'] = location
+            results.append(result)
+        return results
+    
+    def process_batch(self, frames, fps=None):
+        """Process several frames with one recognition call; returns (frame, results) per frame"""
+        if self.mosaic:
+            # Region packing works frame by frame from the previous frame's boxes
+            return [self.process_frame(frame, fps) for frame in frames]
+        
+        detect = [i for i in range(len(frames)) if (self.frame_count + i) % self._detect_every == 0]
+        hashes = {i: _phash(frames[i]) for i in detect}
+        batch_results = [None] * len(frames)
+        for i in detect:
+            batch_results[i] = self._memo_lookup(hashes[i], frames[i])
+        
+        misses = [i for i in detect if batch_results[i] is None]
+        if misses:
+            recognized = self.engine.recognize_faces_batch([frames[i] for i in misses])
+            for i, results in zip(misses, recognized):
+                batch_results[i] = results
+                self._memo_store(hashes[i], results)
+        
+        # Frames between detections re-show the most recent detection's boxes
+        previous = self._last_results
+        for i, results in enumerate(batch_results):
+            if results is None:
+                batch_results[i] = list(previous)
+            else:
+                previous = results
+        
+        return [self._track_results(frame, results, fps) for frame, results in zip(frames, batch_results)]
+    
+    def _memo_lookup(self, frame_hash, frame):
+        """Results of a recent frame whose hash is within memo_max_bits of frame_hash, or None"""
+        now = time.monotonic()
+        for key, (stored_at, results) in list(self._memo.items()):
+            if now - stored_at > self.memo_ttl:
+                del self._memo[key]
+            elif bin(key ^ frame_hash).count('1') <= self.memo_max_bits:
+                # A 9x8 hash can't see a small face entering a still scene; the engine's pixel-level gate can
+                if not self.engine.is_static(frame):
+                    return None
+                self._memo.move_to_end(key)
+                return list(results)
+        return None
+    
+    def _memo_store(self, frame_hash, results):
+        """Remember results for frame_hash, evicting the least recently used entry when full"""
+        self._memo[frame_hash] = (time.monotonic(), list(results))
+        self._memo.move_to_end(frame_hash)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+    
+    def _track_results(self, frame, results, fps=None):
+        """Draw, track and log the recognition results of one frame"""
         self.frame_count += 1
-        results = self.engine.recognize_faces(frame)
+        self._last_results = results
         timestamp = datetime.now()
+        ts_str = _timestamp_str()
         
         for result in results:
             name = result['name']
@@ -26,33 +200,27 @@ class FaceTracker:
             
             # Draw rectangle and label
             top, right, bottom, left = location
-            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
+            color = _COLOR_UNKNOWN if name == "Unknown" else _COLOR_KNOWN
             cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
             
             # Draw label background
             cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
             
-            label = f"{name}"
-            if confidence > 0:
-                label += f" ({confidence:.2%})"
+            label = self._face_label(name, confidence)
             
             cv2.putText(frame, label, (left + 6, bottom - 6),
                        cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
             
             # Track event
-            if name not in self.tracked_faces:
-                self.tracked_faces[name] = {
-                    'first_seen': timestamp,
-                    'last_seen': timestamp,
-                    'count': 1,
-                    'total_confidence': confidence
-                }
-                self.log_event(f"NEW: {name} detected (confidence: {confidence:.2%})")
+            idx = self._name_to_idx.get(name)
+            if idx is None:
+                self._add_tracked(name, timestamp, confidence)
+                self.log_event(f"NEW: {name} detected (confidence: {confidence:.2%})", ts_str)
                 
                 # Save unknown face
                 if name == "Unknown" and self.frame_count % self.unknown_save_interval == 0:
                     filename = self.engine.save_unknown_face(frame, location)
-                    self.log_event(f"Saved unknown face: {filename}")
+                    self.log_event(f"Saved unknown face: {filename}", ts_str)
                 
                 # AI event processing
                 if self.ai_adapter:
@@ -66,67 +234,139 @@ class FaceTracker:
                     try:
                         ai_response = self.ai_adapter.analyze(event_data)
                         if ai_response and isinstance(ai_response, str):
-                            self.log_event(f"AI: {ai_response}")
+                            self.log_event(f"AI: {ai_response}", ts_str)
                     except Exception as e:
-                        self.log_event(f"AI Error: {e}")
+                        self.log_event(f"AI Error: {e}", ts_str)
             else:
-                self.tracked_faces[name]['last_seen'] = timestamp
-                self.tracked_faces[name]['count'] += 1
-                self.tracked_faces[name]['total_confidence'] += confidence
+                self._last[idx] = timestamp
+                self._counts[idx] += 1
+                self._totals[idx] += confidence
         
         # Add info overlay
-        self._draw_info_overlay(frame)
+        self._draw_info_overlay(frame, fps)
         
         return frame, results
     
-    def _draw_info_overlay(self, frame):
-        """Draw information overlay on frame"""
-        h, w = frame.shape[:2]
+    def _face_label(self, name, confidence):
+        """Box label for a face, formatted once per distinct (name, displayed confidence)"""
+        # 4 decimals of the fraction is exactly the .2% shown on screen
+        key = (name, round(float(confidence), 4))
+        label = self._label_cache.get(key)
+        if label is None:
+            if len(self._label_cache) >= self._label_cache_size:
+                self._label_cache.clear()
+            label = f"{name} ({key[1]:.2%})" if confidence > 0 else f"{name}"
+            self._label_cache[key] = label
+        return label
+    
+    def _add_tracked(self, name, timestamp, confidence):
+        """Give a newly seen name the next slot, doubling the arrays when full"""
+        idx = len(self._name_to_idx)
+        if idx == len(self._counts):
+            self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+            self._totals = np.concatenate([self._totals, np.zeros_like(self._totals)])
+            self._first.extend([None] * idx)
+            self._last.extend([None] * idx)
         
-        # Semi-transparent overlay
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (10, 10), (300, 120), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+        self._name_to_idx[name] = idx
+        self._counts[idx] = 1
+        self._totals[idx] = confidence
+        self._first[idx] = timestamp
+        self._last[idx] = timestamp
+    
+    def _draw_info_overlay(self, frame, fps=None):
+        """Draw information overlay on frame"""
+        # Semi-transparent overlay, blended in place over the panel region only
+        roi = frame[10:120, 10:300]
+        panel = self._overlay_roi[:roi.shape[0], :roi.shape[1]]
+        cv2.addWeighted(panel, 0.6, roi, 0.4, 0, dst=roi)
         
         # System info
         cv2.putText(frame, "THE MACHINE v2.0", (20, 35),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(frame, f"Tracking: {len(self.tracked_faces)} faces", (20, 60),
+        cv2.putText(frame, f"Tracking: {len(self._name_to_idx)} faces", (20, 60),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         cv2.putText(frame, f"Events: {len(self.events)}", (20, 85),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        if fps is not None:
+            cv2.putText(frame, f"FPS: {fps:.1f}", (200, 85),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
         
         ai_status = "AI: Active" if self.ai_adapter else "AI: Offline"
         color = (0, 255, 0) if self.ai_adapter else (0, 0, 255)
         cv2.putText(frame, ai_status, (20, 110),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
     
-    def log_event(self, message):
-        """Log system event"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        event = f"[{timestamp}] {message}"
+    def log_event(self, message, ts_str=None):
+        """Log system event; ts_str is a precomputed timestamp for events raised in the same frame"""
+        event = f"[{ts_str or _timestamp_str()}] {message}"
         self.events.append(event)
-        print(event)
-        
-        # Keep only last 1000 events in memory
-        if len(self.events) > 1000:
-            self.events = self.events[-1000:]
+        if self._writer is None:
+            self._log_q = queue.Queue()
+            self._writer = threading.Thread(target=self._event_writer, args=(self._log_q,), daemon=True)
+            self._writer.start()
+        self._log_q.put_nowait(event)
+    
+    def _event_writer(self, log_q):
+        """Drain queued events to stdout (and event_log_file) in chunks of up to _log_batch; None stops it"""
+        stop = False
+        while not stop:
+            batch = [log_q.get()]
+            while len(batch) < self._log_batch:
+                try:
+                    batch.append(log_q.get_nowait())
+                except queue.Empty:
+                    break
+            
+            taken = len(batch)
+            if None in batch:
+                # close() puts the sentinel after the last event
+                stop = True
+                batch = batch[:batch.index(None)]
+            try:
+                if batch:
+                    text = '\n'.join(batch) + '\n'
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                    if self.event_log_file:
+                        with open(self.event_log_file, 'a') as f:
+                            f.write(text)
+            except Exception as e:
+                sys.stderr.write(f"Failed to write events: {e}\n")
+            finally:
+                for _ in range(taken):
+                    log_q.task_done()
+    
+    def flush_events(self):
+        """Block until every queued event has been written"""
+        if self._log_q is not None:
+            self._log_q.join()
+    
+    def close(self):
+        """Write any queued events and stop the writer thread; a later event starts a new one"""
+        if self._writer is None:
+            return
+        self._log_q.put(None)
+        self._writer.join()
+        self._writer = None
+        self._log_q = None
     
     def get_stats(self):
         """Get tracking statistics"""
         stats = {
-            'total_faces': len(self.tracked_faces),
+            'total_faces': len(self._name_to_idx),
             'events': len(self.events),
             'tracked': {}
         }
         
-        for name, data in self.tracked_faces.items():
-            avg_confidence = data['total_confidence'] / data['count']
+        n = len(self._name_to_idx)
+        avg_confidence = self._totals[:n] / self._counts[:n]
+        for name, idx in self._name_to_idx.items():
             stats['tracked'][name] = {
-                'first_seen': data['first_seen'].strftime("%Y-%m-%d %H:%M:%S"),
-                'last_seen': data['last_seen'].strftime("%Y-%m-%d %H:%M:%S"),
-                'detections': data['count'],
-                'avg_confidence': f"{avg_confidence:.2%}"
+                'first_seen': self._first[idx].strftime(_TS_FORMAT),
+                'last_seen': self._last[idx].strftime(_TS_FORMAT),
+                'detections': int(self._counts[idx]),
+                'avg_confidence': f"{avg_confidence[idx]:.2%}"
             }
         
         return stats
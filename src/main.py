@@ -1,7 +1,10 @@
 """Main entry point and CLI interface"""
 import cv2
+import logging
 import sys
 import os
+import queue
+import threading
 import time
 from face_recognition import FaceRecognitionEngine
 from face_tracking import FaceTracker
@@ -16,11 +19,15 @@ class TheMachine:
         self.tracker = None
         self.admin = AdminInterface()
         self.running = False
+        # Longest time a frame waits for its recognition batch to fill
+        self.max_batch_latency = 0.1
     
     def initialize_ai(self, provider="mock", api_key=None):
         """Initialize AI provider"""
         print(f"\nInitializing AI provider: {provider}")
         self.ai_adapter = AIAdapter(provider, api_key)
+        if self.tracker:
+            self.tracker.close()
         self.tracker = FaceTracker(self.engine, self.ai_adapter)
         print("✓ AI integration ready")
     
@@ -39,7 +46,12 @@ class TheMachine:
         print("  'r' - Reload known faces")
         print("="*60)
         
-        cap = cv2.VideoCapture(0)
+        # V4L2 directly on Linux; the default backend there can fall back to GStreamer
+        cap = cv2.VideoCapture(0, cv2.CAP_V4L2) if sys.platform.startswith('linux') else cv2.VideoCapture(0)
+        if not cap.isOpened():
+            # Some cameras only open through the default (e.g. GStreamer) backend
+            cap.release()
+            cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             print("✗ Error: Cannot access camera")
             print("Please check:")
@@ -48,56 +60,98 @@ class TheMachine:
             print("  3. Camera permissions are granted")
             return
         
-        # Set camera properties
+        # Set camera properties; MJPG first, since raw YUYV at 720p saturates USB 2.0 well below 30 FPS
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        cap.set(cv2.CAP_PROP_FPS, 30)
         
-        print("✓ Camera initialized")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        fourcc = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4))
+        print(f"✓ Camera initialized ({fourcc} {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x"
+              f"{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))} @ {cap.get(cv2.CAP_PROP_FPS):.0f} FPS)")
         print("Starting surveillance...")
         
+        # Capture runs on its own thread; keep OpenCV single-threaded so the two don't oversubscribe cores
+        cv2.setNumThreads(1)
         self.running = True
-        frame_count = 0
-        fps_start = time.time()
+        frames = queue.Queue(maxsize=1)
+        capture = threading.Thread(target=self._capture_frames, args=(cap, frames), daemon=True)
+        capture.start()
+        fps = 0.0
+        prev_read = time.perf_counter()
+        batch = []
+        batch_deadline = 0.0
         
         while self.running:
-            ret, frame = cap.read()
-            if not ret:
+            frame = frames.get()
+            if frame is None:
                 print("Failed to grab frame")
                 break
             
-            # Process frame
-            processed_frame, results = self.tracker.process_frame(frame)
+            # Smoothed rate of frames taken from the capture thread, drawn inside the tracker overlay
+            now = time.perf_counter()
+            if now > prev_read:
+                instant_fps = 1.0 / (now - prev_read)
+                fps = 0.9 * fps + 0.1 * instant_fps if fps else instant_fps
+            prev_read = now
             
-            # Calculate FPS
-            frame_count += 1
-            if frame_count % 30 == 0:
-                fps = 30 / (time.time() - fps_start)
-                cv2.putText(processed_frame, f"FPS: {fps:.1f}", (processed_frame.shape[1] - 150, 35),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                fps_start = time.time()
+            # Accumulate frames so recognition runs once per batch, flushing early to keep latency bounded
+            if not batch:
+                batch_deadline = time.monotonic() + self.max_batch_latency
+            batch.append(frame)
+            if len(batch) < self.engine.batch_size and time.monotonic() < batch_deadline:
+                continue
             
-            # Display
-            cv2.imshow('The Machine v2.0 - Surveillance', processed_frame)
+            processed = self.tracker.process_batch(batch, fps=fps)
+            batch = []
             
-            # Handle keys
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                print("\nShutting down surveillance...")
-                break
-            elif key == ord('s'):
-                filename = f"capture_{int(time.time())}.jpg"
-                cv2.imwrite(filename, frame)
-                print(f"✓ Frame saved: {filename}")
-            elif key == ord('l'):
-                self.tracker.save_events_log()
-            elif key == ord('r'):
-                print("\nReloading known faces...")
-                self.engine.load_known_faces()
+            for processed_frame, results in processed:
+                # Display
+                cv2.imshow('The Machine v2.0 - Surveillance', processed_frame)
+                
+                # Handle keys
+                key = cv2.waitKey(1) & 0xFF
+                if not self._handle_camera_key(key, processed_frame):
+                    self.running = False
+                    break
         
+        self.running = False
+        capture.join()
         cap.release()
         cv2.destroyAllWindows()
+        self.tracker.flush_events()
         print("✓ Camera mode ended")
     
+    def _capture_frames(self, cap, frames):
+        """Read frames into a size-1 queue, replacing any frame not yet consumed; None marks a failed read"""
+        while self.running:
+            ret, frame = cap.read()
+            if frames.full():
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
+            frames.put(frame if ret else None)
+            if not ret:
+                return
+    
+    def _handle_camera_key(self, key, frame):
+        """Handle a camera-mode key press; returns False when surveillance should stop"""
+        if key == ord('q'):
+            print("\nShutting down surveillance...")
+            return False
+        elif key == ord('s'):
+            filename = f"capture_{int(time.time())}.jpg"
+            cv2.imwrite(filename, frame)
+            print(f"✓ Frame saved: {filename}")
+        elif key == ord('l'):
+            self.tracker.save_events_log()
+        elif key == ord('r'):
+            print("\nReloading known faces...")
+            self.engine.load_known_faces()
+        return True
+    
     def show_stats(self):
         """Display system statistics"""
         if not self.tracker:
@@ -184,6 +238,13 @@ class TheMachine:
                 print("Invalid option. Please select 1-5.")
 
 if __name__ == "__main__":
+    # Engine/provider status goes through logging; no-op if the host already configured handlers.
+    # Libraries stay at WARNING (httpx logs every request at INFO); only our modules report INFO,
+    # under both import paths in use (admin modules import them as src.<name>)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    for name in ("face_recognition", "ai_adapters", "secure_storage"):
+        logging.getLogger(name).setLevel(logging.INFO)
+        logging.getLogger(f"src.{name}").setLevel(logging.INFO)
     try:
         print("\n" + "="*60)
         print("Booting The Machine v2.0...")
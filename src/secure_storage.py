@@ -2,11 +2,21 @@
 import os
 import json
 import hashlib
+import logging
+import ssl
+import struct
+import cbor2
+import numpy as np
 from ecdsa import SigningKey, VerifyingKey, SECP256k1, BadSignatureError
 from ecdsa.util import sigencode_string, sigdecode_string
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from pathlib import Path
 import base64
 
+log = logging.getLogger(__name__)
+# hashlib's SHA-256/scrypt come from this OpenSSL; 1.1.1+ uses SHA-NI where the CPU has it
+log.debug("hashlib backed by %s", ssl.OPENSSL_VERSION)
+
 class ECCSecureStorage:
     """
     Elliptic Curve Cryptography (ECC) based secure storage
@@ -17,7 +27,8 @@ class ECCSecureStorage:
         self.key_path = key_path
         self.private_key_file = os.path.join(key_path, "private.pem")
         self.public_key_file = os.path.join(key_path, "public.pem")
-        self.data_file = "src/secure_data.json"
+        self.data_file = "src/secure_data.cbor"
+        self.legacy_data_file = "src/secure_data.json"  # Base64-in-JSON format, read until the next save
         self.private_key, self.public_key = self._load_or_create_keys()
     
     def _load_or_create_keys(self):
@@ -48,48 +59,101 @@ class ECCSecureStorage:
         
         return private_key, public_key
     
+    @staticmethod
+    def _xor_keystream(data, key):
+        """XOR data with the key repeated to its length, vectorized with NumPy"""
+        buf = np.frombuffer(data, dtype=np.uint8)
+        keystream = np.resize(np.frombuffer(key, dtype=np.uint8), buf.shape)
+        return (buf ^ keystream).tobytes()
+    
+    @staticmethod
+    def _derive_key(password, salt, kdf):
+        """Derive the 32-byte encryption key; 'pbkdf2' is kept for data saved before scrypt"""
+        if kdf == 'scrypt':
+            return hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1, dklen=32)
+        if kdf == 'pbkdf2':
+            return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000, dklen=32)
+        raise ValueError(f"Unknown key derivation: {kdf}")
+    
     def _symmetric_encrypt(self, data, password):
         """
-        Symmetric encryption using password-derived key
+        Authenticated encryption (AES-256-GCM) using password-derived key
         Similar to Bitcoin wallet encryption
         """
-        # Derive key from password using PBKDF2
+        # Derive key from password using scrypt
         salt = os.urandom(32)
-        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000, dklen=32)
+        key = self._derive_key(password, salt, 'scrypt')
         
-        # Simple XOR encryption (replace with AES for production)
+        # OpenSSL runs AES-GCM on AES-NI / ARMv8 crypto extensions where available
+        nonce = os.urandom(12)
         data_bytes = data.encode() if isinstance(data, str) else data
-        encrypted = bytes(a ^ b for a, b in zip(data_bytes, (key * (len(data_bytes) // len(key) + 1))[:len(data_bytes)]))
+        ct = AESGCM(key).encrypt(nonce, data_bytes, None)
         
         return {
-            'salt': base64.b64encode(salt).decode(),
-            'data': base64.b64encode(encrypted).decode()
+            'kdf': 'scrypt',
+            'salt': salt,
+            'nonce': nonce,
+            'ct': ct
         }
     
-    def _symmetric_decrypt(self, encrypted_data, password):
+    @staticmethod
+    def _raw(value):
+        """Bytes field as stored in CBOR, or decoded from the base64 string of the legacy JSON file"""
+        return value if isinstance(value, bytes) else base64.b64decode(value)
+    
+    @staticmethod
+    def _blob_format(encrypted_data, legacy):
+        """'aes-gcm' or 'xor', decided once for both signature check and decryption"""
+        has_aes = 'ct' in encrypted_data or 'nonce' in encrypted_data
+        if has_aes and 'data' in encrypted_data:
+            raise ValueError("Encrypted data mixes AES-GCM and legacy XOR fields")
+        if has_aes:
+            if 'ct' not in encrypted_data or 'nonce' not in encrypted_data:
+                raise ValueError("Encrypted data is missing its ciphertext or nonce")
+            return 'aes-gcm'
+        # XOR blobs only ever existed in the legacy JSON file
+        if legacy and 'data' in encrypted_data:
+            return 'xor'
+        raise ValueError("Unrecognized encrypted data format")
+    
+    @staticmethod
+    def _signed_message(encrypted_data, fmt, legacy):
+        """Bytes covered by the signature for a blob of the given format"""
+        if legacy:
+            # The JSON format signed only the base64 ciphertext string
+            return encrypted_data['ct'] if fmt == 'aes-gcm' else encrypted_data['data']
+        # Length-prefixed kdf || salt || nonce || ct, so no header field can be swapped without the key
+        fields = (encrypted_data['kdf'], encrypted_data['salt'], encrypted_data['nonce'], encrypted_data['ct'])
+        if not isinstance(fields[0], str) or not all(isinstance(field, bytes) for field in fields[1:]):
+            raise ValueError("Encrypted data fields have the wrong types")
+        fields = (fields[0].encode(),) + fields[1:]
+        return b''.join(struct.pack('>I', len(field)) + field for field in fields)
+    
+    def _symmetric_decrypt(self, encrypted_data, password, fmt):
         """Decrypt data encrypted with symmetric key"""
-        salt = base64.b64decode(encrypted_data['salt'])
-        encrypted = base64.b64decode(encrypted_data['data'])
+        salt = self._raw(encrypted_data['salt'])
         
         # Derive same key
-        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000, dklen=32)
+        key = self._derive_key(password, salt, encrypted_data.get('kdf', 'pbkdf2'))
         
-        # Decrypt
-        decrypted = bytes(a ^ b for a, b in zip(encrypted, (key * (len(encrypted) // len(key) + 1))[:len(encrypted)]))
-        return decrypted
+        if fmt == 'xor':
+            # Legacy XOR format written before AES-GCM; re-encrypted on next save
+            return self._xor_keystream(self._raw(encrypted_data['data']), key)
+        
+        nonce = self._raw(encrypted_data['nonce'])
+        ct = self._raw(encrypted_data['ct'])
+        return AESGCM(key).decrypt(nonce, ct, None)
     
     def sign_data(self, data):
         """Sign data with private key (like Bitcoin transaction signing)"""
         data_bytes = data.encode() if isinstance(data, str) else data
-        signature = self.private_key.sign(data_bytes, sigencode=sigencode_string)
-        return base64.b64encode(signature).decode()
+        return self.private_key.sign(data_bytes, sigencode=sigencode_string)
     
     def verify_signature(self, data, signature):
-        """Verify signature with public key"""
+        """Verify signature with public key (raw bytes, or base64 from the legacy JSON file)"""
         try:
             data_bytes = data.encode() if isinstance(data, str) else data
-            sig_bytes = base64.b64decode(signature)
-            self.public_key.verify(sig_bytes, data_bytes, sigdecode=sigdecode_string)
+            self.public_key.verify(self._raw(signature), data_bytes, sigdecode=sigdecode_string)
             return True
         except BadSignatureError:
             return False
@@ -102,32 +166,48 @@ class ECCSecureStorage:
         encrypted = self._symmetric_encrypt(json_data, password)
         
         # Sign encrypted data for integrity
-        signature = self.sign_data(encrypted['data'])
+        signature = self.sign_data(self._signed_message(encrypted, 'aes-gcm', legacy=False))
         
-        # Save with signature
+        # Save with signature; CBOR keeps the binary fields as raw bytes
         output = {
             'encrypted': encrypted,
             'signature': signature,
-            'public_key': base64.b64encode(self.public_key.to_string()).decode()
+            'public_key': self.public_key.to_string()
         }
         
-        with open(self.data_file, 'w') as f:
-            json.dump(output, f, indent=2)
+        # Write beside the target and swap it in, so a failed save never leaves a truncated file
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            cbor2.dump(output, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+        
+        # The legacy JSON copy may be XOR-"encrypted"; drop it once the CBOR file is in place
+        if os.path.exists(self.legacy_data_file):
+            os.remove(self.legacy_data_file)
     
     def load_data(self, password="default"):
         """Load and verify signed data"""
-        if not os.path.exists(self.data_file):
+        legacy = False
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'rb') as f:
+                stored = cbor2.load(f)
+        elif os.path.exists(self.legacy_data_file):
+            legacy = True
+            with open(self.legacy_data_file, 'r') as f:
+                stored = json.load(f)
+        else:
             return {}
         
-        with open(self.data_file, 'r') as f:
-            stored = json.load(f)
-        
         # Verify signature
-        if not self.verify_signature(stored['encrypted']['data'], stored['signature']):
+        encrypted = stored['encrypted']
+        fmt = self._blob_format(encrypted, legacy)
+        if not self.verify_signature(self._signed_message(encrypted, fmt, legacy), stored['signature']):
             raise ValueError("Data signature verification failed! Data may be tampered.")
         
         # Decrypt
-        decrypted = self._symmetric_decrypt(stored['encrypted'], password)
+        decrypted = self._symmetric_decrypt(encrypted, password, fmt)
         return json.loads(decrypted)
     
     def hash_password(self, password):
@@ -175,4 +255,5 @@ if __name__ == "__main__":
     print("- SECP256k1 elliptic curve (Bitcoin standard)")
     print("- Double SHA256 password hashing")
     print("- ECDSA signature verification")
-    print("- PBKDF2 key derivation (100,000 iterations)")
+    print("- scrypt key derivation (N=2^14, r=8, p=1)")
+    print("- AES-256-GCM authenticated encryption")
@@ -11,11 +11,13 @@ def resize_image(img, max_width=800):
         img = cv2.resize(img, (max_width, int(h * ratio)))
     return img
 
-def enhance_image(img):
-    """Apply basic image enhancement"""
+# Shared CLAHE instance so its tile histograms aren't reallocated per call
+_clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+
+def enhance_image(img, inplace=False):
+    """Apply basic image enhancement (writes into img when inplace=True)"""
     lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-    l = clahe.apply(l)
-    enhanced = cv2.merge([l,a,b])
-    return cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
+    # Equalize the L channel in place instead of split/merge copies;
+    # a strided view can't be a cv2 dst, so assign the result back
+    lab[:, :, 0] = _clahe.apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=img if inplace else None)
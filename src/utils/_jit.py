@@ -0,0 +1,42 @@
+"""Optional Numba kernels; without numba they run as plain Python"""
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    
+    def njit(**kwargs):
+        """No-op stand-in for numba.njit"""
+        return lambda f: f
+
+@njit(cache=True)
+def dhash_bits(small):
+    """Difference hash of a (rows, cols + 1) grayscale image, first pixel pair as the high bit"""
+    h = np.uint64(0)
+    one = np.uint64(1)
+    for y in range(small.shape[0]):
+        for x in range(small.shape[1] - 1):
+            h = h << one
+            if small[y, x + 1] > small[y, x]:
+                h = h | one
+    return h
+
+@njit(cache=True, fastmath=True)
+def best_match(mat, probes):
+    """Per-probe index and squared L2 distance of the closest row of mat"""
+    # Rows are the outer loop: each gallery row is read once and stays in L1 while every probe is scored
+    k = probes.shape[0]
+    best_i = np.full(k, -1, dtype=np.int64)
+    best = np.full(k, 1e30, dtype=np.float32)
+    for i in range(mat.shape[0]):
+        for p in range(k):
+            s = 0.0
+            for j in range(mat.shape[1]):
+                d = mat[i, j] - probes[p, j]
+                s += d * d
+            if s < best[p]:
+                best[p] = s
+                best_i[p] = i
+    return best_i, best
@@ -0,0 +1,65 @@
+"""MOSAIC-style packing of several image regions into one detection canvas"""
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Placement of one source image on the canvas: canvas = offset + source * scale
+Tile = namedtuple('Tile', ['offset_x', 'offset_y', 'scale', 'width', 'height'])
+
+def build_canvas(images, C=640, min_tile=64):
+    """Pack images on a square grid inside a C x C canvas, shrinking them to fit but never enlarging
+
+    Returns (canvas, tiles), or None when an image would shrink below
+    min_tile pixels on its short side and detection accuracy would suffer.
+    """
+    if not images:
+        return None
+
+    grid = math.ceil(math.sqrt(len(images)))
+    cell = C // grid
+    canvas = np.zeros((C, C, 3), dtype=np.uint8)
+    tiles = []
+
+    for i, img in enumerate(images):
+        h, w = img.shape[:2]
+        scale = min(cell / w, cell / h, 1.0)
+        if min(w, h) * scale < min_tile:
+            return None
+
+        tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+        ox, oy = (i % grid) * cell, (i // grid) * cell
+        canvas[oy:oy + th, ox:ox + tw] = img if scale == 1.0 else cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA)
+        tiles.append(Tile(ox, oy, scale, tw, th))
+
+    return canvas, tiles
+
+def unmap_location(location, tiles):
+    """Map a (top, right, bottom, left) canvas box to (tile index, box in source coordinates)
+
+    The tile is chosen by the box center; returns None if the center lies
+    outside every tile (e.g. in canvas padding).
+    """
+    top, right, bottom, left = location
+    cx, cy = (left + right) / 2, (top + bottom) / 2
+
+    for i, tile in enumerate(tiles):
+        if tile.offset_x <= cx < tile.offset_x + tile.width and tile.offset_y <= cy < tile.offset_y + tile.height:
+            return i, (
+                int((top - tile.offset_y) / tile.scale),
+                int((right - tile.offset_x) / tile.scale),
+                int((bottom - tile.offset_y) / tile.scale),
+                int((left - tile.offset_x) / tile.scale)
+            )
+    return None
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    inter_h = min(a[2], b[2]) - max(a[0], b[0])
+    inter_w = min(a[1], b[1]) - max(a[3], b[3])
+    if inter_h <= 0 or inter_w <= 0:
+        return 0.0
+    inter = inter_h * inter_w
+    union = (a[2] - a[0]) * (a[1] - a[3]) + (b[2] - b[0]) * (b[1] - b[3]) - inter
+    return inter / union if union > 0 else 0.0
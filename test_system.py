@@ -1,4 +1,5 @@
 """Quick system test"""
+import importlib
 import sys
 import os
 
@@ -11,36 +12,75 @@ print("="*60)
 print("")
 
 # Test imports
-tests_passed = 0
-tests_total = 0
-
-def test_module(name, import_statement):
-    global tests_passed, tests_total
-    tests_total += 1
+def test_module(name, module, attrs=()):
     try:
-        exec(import_statement)
+        m = importlib.import_module(module)
+        for attr in attrs:
+            getattr(m, attr)
         print(f"✓ {name}")
-        tests_passed += 1
         return True
     except Exception as e:
         print(f"✗ {name}: {e}")
         return False
 
-# Core modules
-test_module("Secure Storage (ECC)", "from secure_storage import ECCSecureStorage")
-test_module("Face Recognition", "from face_recognition import FaceRecognitionEngine")
-test_module("Face Tracking", "from face_tracking import FaceTracker")
-test_module("Admin Manager", "from admin import AdminManager")
-test_module("Admin Interface", "from admin_clean import AdminInterface")
-
-# AI modules
-test_module("AI Core", "from ai_core import MockAIProvider")
-test_module("AI Adapters", "from ai_adapters import AIAdapter, OpenAIProvider, DeepFaceProvider")
-test_module("AI Hooks", "from ai_hooks import AIHooks")
-test_module("AI Loader", "from ai_loader import AILoader")
+results = [
+    # Core modules
+    test_module("Secure Storage (ECC)", "secure_storage", ("ECCSecureStorage",)),
+    test_module("Face Recognition", "face_recognition", ("FaceRecognitionEngine",)),
+    test_module("Face Tracking", "face_tracking", ("FaceTracker",)),
+    test_module("Admin Manager", "admin", ("AdminManager",)),
+    test_module("Admin Interface", "admin_clean", ("AdminInterface",)),
+    
+    # AI modules
+    test_module("AI Core", "ai_core", ("MockAIProvider",)),
+    test_module("AI Adapters", "ai_adapters", ("AIAdapter", "OpenAIProvider", "DeepFaceProvider")),
+    test_module("AI Hooks", "ai_hooks", ("AIHooks",)),
+    test_module("AI Loader", "ai_loader", ("AILoader",)),
+    
+    # Main entry
+    test_module("Main System", "main", ("TheMachine",)),
+]
+def test_storage_migration():
+    """Write a legacy XOR/JSON store, load it, save it, and read back the CBOR file"""
+    name = "Secure Storage Migration"
+    try:
+        import base64
+        import hashlib
+        import json
+        import tempfile
+        from secure_storage import ECCSecureStorage
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = ECCSecureStorage(key_path=os.path.join(tmp, "keys"))
+            storage.data_file = os.path.join(tmp, "secure_data.cbor")
+            storage.legacy_data_file = os.path.join(tmp, "secure_data.json")
+            
+            # Same layout the pre-AES code wrote: PBKDF2 key, XOR stream, signature over the base64 data
+            data = {"admin": {"password": "hash", "face_enrolled": False}}
+            salt = os.urandom(32)
+            key = hashlib.pbkdf2_hmac('sha256', b"pw", salt, 100000, dklen=32)
+            xored = storage._xor_keystream(json.dumps(data).encode(), key)
+            blob = {'salt': base64.b64encode(salt).decode(), 'data': base64.b64encode(xored).decode()}
+            with open(storage.legacy_data_file, 'w') as f:
+                json.dump({
+                    'encrypted': blob,
+                    'signature': base64.b64encode(storage.sign_data(blob['data'])).decode(),
+                    'public_key': base64.b64encode(storage.public_key.to_string()).decode()
+                }, f)
+            
+            assert storage.load_data("pw") == data
+            storage.save_data(data, "pw")
+            assert not os.path.exists(storage.legacy_data_file), "legacy JSON left behind"
+            assert storage.load_data("pw") == data
+        print(f"✓ {name}")
+        return True
+    except Exception as e:
+        print(f"✗ {name}: {e}")
+        return False
 
-# Main entry
-test_module("Main System", "from main import TheMachine")
+results.append(test_storage_migration())
+tests_passed = sum(results)
+tests_total = len(results)
 
 print("")
 print("="*60)